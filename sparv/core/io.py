@@ -35,10 +35,7 @@ def write_annotation(doc, annotation, values, append=False, allow_newlines=False
 
     The annotation should be a list of values.
     """
-    if isinstance(annotation, BaseAnnotation):
-        annotation = annotation.name.split()
-    elif isinstance(annotation, str):
-        annotation = annotation.split()
+    annotation = _annotation_name_list(annotation)
 
     if len(annotation) == 1:
         # Handle single annotation
@@ -60,6 +57,15 @@ def write_annotation(doc, annotation, values, append=False, allow_newlines=False
                                      annotation_values[annotation_name], append, allow_newlines)
 
 
+def _annotation_name_list(annotation):
+    """Return a list of annotation names, given an annotation object, a space separated string or a list of names."""
+    if isinstance(annotation, BaseAnnotation):
+        return annotation.name.split()
+    elif isinstance(annotation, str):
+        return annotation.split()
+    return annotation
+
+
 def _write_single_annotation(doc, annotation, values, append, allow_newlines=False):
     """Write an annotation to a file."""
     is_span = not split_annotation(annotation)[1]
@@ -136,10 +142,7 @@ def read_annotation_spans(doc, annotation, decimals=False, with_annotation_name=
 
 def read_annotation(doc, annotation, with_annotation_name=False, allow_newlines=False):
     """Yield each line from an annotation file."""
-    if isinstance(annotation, BaseAnnotation):
-        annotation = annotation.name.split()
-    elif isinstance(annotation, str):
-        annotation = annotation.split()
+    annotation = _annotation_name_list(annotation)
     if len(annotation) == 1:
         # Handle single annotation
         yield from _read_single_annotation(doc, annotation[0], with_annotation_name, allow_newlines)
@@ -175,12 +178,13 @@ def read_annotation_attributes(doc, annotations, with_annotation_name=False, all
 def _read_single_annotation(doc, annotation, with_annotation_name, allow_newlines=False):
     """Read a single annotation file."""
     ann_file = get_annotation_path(doc, annotation)
+    is_span = not split_annotation(annotation)[1]
 
     with open(ann_file) as f:
         ctr = 0
         for line in f:
             value = line.rstrip("\n\r")
-            if not split_annotation(annotation)[1]:  # If this is a span annotation
+            if is_span:
                 value = tuple(tuple(map(int, pos.split("."))) for pos in value.split("-"))
             elif allow_newlines:
                 # Replace literal "\n" with line break (if we allow "\n" in values)
@@ -5,6 +5,7 @@ import pkgutil
 import re
 from collections import defaultdict
 from enum import Enum
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Type, TypeVar
 
 import typing_inspect
@@ -19,6 +20,10 @@ modules_path = ".".join(("sparv", paths.modules_dir))
 core_modules_path = ".".join(("sparv", paths.core_modules_dir))
 custom_name = "custom"
 
+# Config variable references ([config.key] or [config.key=default]) and class references (<class>)
+_config_variable_re = re.compile(r"\[([^\]=[]+)(?:=([^\][]+))?\]")
+_class_re = re.compile(r"<([^>]+)>")
+
 
 class Annotator(Enum):
     """Annotator types."""
@@ -254,11 +259,12 @@ def _add_to_registry(annotator):
     f_name = annotator["function"].__name__ if not annotator["name"] else annotator["name"]
     rule_name = f"{module_name}:{f_name}"
 
+    corpus_language = sparv_config.get("metadata.language")
     if annotator["language"]:
         # Add to set of supported languages...
         languages.update(annotator["language"])
         # ... but skip annotators for other languages than the one specified in the config
-        if sparv_config.get("metadata.language") and sparv_config.get("metadata.language") not in annotator["language"]:
+        if corpus_language and corpus_language not in annotator["language"]:
             return
 
     # Add config variables to config
@@ -272,7 +278,10 @@ def _add_to_registry(annotator):
             sparv_config.set_value("import.document_annotation", annotator["document_annotation"])
             sparv_config.handle_document_annotation()
 
-    for param, val in inspect.signature(annotator["function"]).parameters.items():
+    # Keep the function's parameters, to avoid inspecting its signature again for every rule created from it
+    annotator["parameters"] = inspect.signature(annotator["function"]).parameters
+
+    for param, val in annotator["parameters"].items():
         if isinstance(val.default, BaseOutput):
             ann = val.default
             cls = val.default.cls
@@ -310,7 +319,7 @@ def _add_to_registry(annotator):
 
                     # Only add classes for relevant languages
                     if not annotator["language"] or (
-                            annotator["language"] and sparv_config.get("metadata.language") in annotator["language"]):
+                            annotator["language"] and corpus_language in annotator["language"]):
                         annotation_classes["module_classes"][cls].append(cls_target)
 
         elif isinstance(val.default, ModelOutput):
@@ -390,19 +399,23 @@ def _expand_class(cls):
 
 def find_config_variables(string, match_objects: bool = False):
     """Find all config variables in a string and return a list of strings or match objects."""
+    if "[" not in string:
+        return []
     if match_objects:
-        result = list(re.finditer(r"\[([^\]=[]+)(?:=([^\][]+))?\]", string))
+        result = list(_config_variable_re.finditer(string))
     else:
-        result = [c.group()[1:-1] for c in re.finditer(r"\[([^\]=[]+)(?:=([^\][]+))?\]", string)]
+        result = [c.group()[1:-1] for c in _config_variable_re.finditer(string)]
     return result
 
 
 def find_classes(string, match_objects: bool = False):
     """Find all class references in a string and return a list of strings or match objects."""
+    if "<" not in string:
+        return []
     if match_objects:
-        result = list(re.finditer(r"<([^>]+)>", string))
+        result = list(_class_re.finditer(string))
     else:
-        result = [c.group()[1:-1] for c in re.finditer(r"<([^>]+)>", string)]
+        result = [c.group()[1:-1] for c in _class_re.finditer(string)]
     return result
 
 
@@ -417,6 +430,10 @@ def expand_variables(string, rule_name: Optional[str] = None, is_annotation: boo
     Returns:
         The resulting string and a list of any unresolved config references.
     """
+    # Nothing to expand
+    if "[" not in string and "<" not in string and not (is_annotation and ", " in string):
+        return string, []
+
     rest = []
 
     if is_annotation:
@@ -476,8 +493,12 @@ def expand_variables(string, rule_name: Optional[str] = None, is_annotation: boo
     return string, rest
 
 
+@lru_cache(maxsize=None)
 def get_type_hint_type(type_hint):
-    """Given a type hint, return the type, whether it's contained in a List and whether it's Optional."""
+    """Given a type hint, return the type, whether it's contained in a List and whether it's Optional.
+
+    The result is cached, since the same type hints are resolved for every rule and parameter.
+    """
     optional = typing_inspect.is_optional_type(type_hint)
     if optional:
         type_hint = typing_inspect.get_args(type_hint)[0]
@@ -54,7 +54,7 @@ def main(argv=None, log_level: str = "info"):
         required_args = subparser.add_argument_group("required named arguments")
         needs_doc = False
         has_doc = False
-        for parameter in inspect.signature(f).parameters.items():
+        for parameter in annotator["parameters"].items():
             param_ann = parameter[1].annotation
             param_default = parameter[1].default
             is_optional = False
@@ -103,6 +103,14 @@ def print_modules(modules: dict, module_type: str, reverse_config_usage: dict, s
     minimal = box.Box("    \n  │ \n╶─┼╴\n  │ \n╶─┼╴\n╶─┼╴\n  │ \n    \n")
     box_style = minimal
 
+    def make_table(title, table_box=box_style, columns=2):
+        """Create a table for function info, with all but the last column set to not wrap."""
+        table = Table(title=f"[b]{title}[/b]", box=table_box, show_header=False, title_justify="left",
+                      padding=(0, 2), pad_edge=False, border_style="bright_black")
+        for i in range(columns):
+            table.add_column(no_wrap=i < columns - 1)
+        return table
+
     # Module type header
     print()
     console.print(f"  [b]{module_type.upper()}[/b]", style="reverse", justify="left")  # 'justify' to fill entire width
@@ -124,6 +132,10 @@ def print_modules(modules: dict, module_type: str, reverse_config_usage: dict, s
         if description:
             console.print(Padding(description, (0, 4, 1, 4)))
 
+        # Config variables used by this module's functions, keyed by function name
+        prefix = module_name + ":"
+        module_config_usage = {k[len(prefix):]: v for k, v in reverse_config_usage.items() if k.startswith(prefix)}
+
         for f_name in sorted(modules[module_name]):
             # Function name and description
             f_desc = modules[module_name][f_name]["description"]
@@ -140,11 +152,7 @@ def print_modules(modules: dict, module_type: str, reverse_config_usage: dict, s
             # Annotations
             f_anns = modules[module_name][f_name].get("annotations", {})
             if f_anns:
-                this_box_style = box_style if any(a[1] for a in f_anns) else box.SIMPLE
-                table = Table(title="[b]Annotations[/b]", box=this_box_style, show_header=False,
-                              title_justify="left", padding=(0, 2), pad_edge=False, border_style="bright_black")
-                table.add_column(no_wrap=True)
-                table.add_column()
+                table = make_table("Annotations", box_style if any(a[1] for a in f_anns) else box.SIMPLE)
                 for f_ann in sorted(f_anns):
                     table.add_row("• " + f_ann[0].name + (
                         f"\n  [i dim]class:[/] <{f_ann[0].cls}>" if f_ann[0].cls else ""),
@@ -152,32 +160,23 @@ def print_modules(modules: dict, module_type: str, reverse_config_usage: dict, s
                 console.print(Padding(table, (0, 0, 0, 4)))
             elif custom_params:
                 # Print info about custom annotators
-                this_box_style = box_style if any(a[1] for a in f_anns) else box.SIMPLE
-                table = Table(title="[b]Annotations[/b]", box=this_box_style, show_header=False,
-                              title_justify="left", padding=(0, 2), pad_edge=False, border_style="bright_black")
-                table.add_column()
+                table = make_table("Annotations", box.SIMPLE, columns=1)
                 table.add_row("In order to use this annotator you first need to declare it in the 'custom_annotations' "
                               "section of your corpus configuration and specify its arguments.")
                 console.print(Padding(table, (0, 0, 0, 4)))
 
             # Config variables
-            f_config = reverse_config_usage.get(f"{module_name}:{f_name}")
+            f_config = module_config_usage.get(f_name)
             if f_config:
                 console.print()
-                table = Table(title="[b]Configuration variables used[/b]", box=box_style, show_header=False,
-                              title_justify="left", padding=(0, 2), pad_edge=False, border_style="bright_black")
-                table.add_column(no_wrap=True)
-                table.add_column()
+                table = make_table("Configuration variables used")
                 for config_key in sorted(f_config):
                     table.add_row("• " + config_key[0], config_key[1] or "")
                 console.print(Padding(table, (0, 0, 0, 4)))
 
             # Arguments
             if (print_params and params) or custom_params:
-                table = Table(title="[b]Arguments[/b]", box=box_style, show_header=False, title_justify="left",
-                              padding=(0, 2), pad_edge=False, border_style="bright_black")
-                table.add_column(no_wrap=True)
-                table.add_column()
+                table = make_table("Arguments")
                 for p, (default, typ, li, optional) in params.items():
                     opt_str = "(optional) " if optional else ""
                     typ_str = "list of " + typ.__name__ if li else typ.__name__
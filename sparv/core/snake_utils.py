@@ -3,7 +3,8 @@
 import copy
 import inspect
 import re
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
+from functools import lru_cache
 from itertools import combinations
 from pathlib import Path
 from typing import Any, List, Optional, Set, Tuple
@@ -20,6 +21,10 @@ from sparv.util.classes import (AllDocuments, Annotation, AnnotationAllDocs, Ann
                                 ExportAnnotationsAllDocs, ExportInput, Language, Model, ModelOutput, Output, OutputData,
                                 Source, SourceAnnotations, Text)
 
+# Wildcards other than {doc}
+_WILDCARD_RE = re.compile(r"(?!{doc}){([^}]+)}")
+_ESCAPE_WILDCARD_RE = re.compile(r"(?!{doc})({[^}]+})")
+
 
 class SnakeStorage:
     """Object to store variables involving all rules."""
@@ -60,6 +65,7 @@ class RuleStorage:
         self.full_name = f"{module_name}:{f_name}"  # Used in messages to the user
         self.inputs = []
         self.outputs = []
+        self.outputs_set = frozenset()  # Set of all outputs, for fast comparisons between rules
         self.parameters = {}
         self.docs = []  # List of parameters referring to Document
         self.doc_annotations = []  # List of parameters containing the {doc} wildcard
@@ -103,12 +109,12 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
         return False
 
     # Skip any annotator that is not available for the selected corpus language
-    if rule.annotator_info["language"] and sparv_config.get("metadata.language") and \
-            sparv_config.get("metadata.language") not in rule.annotator_info["language"]:
+    corpus_language = sparv_config.get("metadata.language")
+    if rule.annotator_info["language"] and corpus_language and corpus_language not in rule.annotator_info["language"]:
         return False
 
     # Get this function's parameters
-    params = OrderedDict(inspect.signature(rule.annotator_info["function"]).parameters)
+    params = rule.annotator_info["parameters"]
     param_dict = make_param_dict(params)
 
     if rule.importer:
@@ -220,12 +226,13 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
             if "{" in param_value:
                 rule.wildcard_annotations.append(param_name)
             if rule.annotator:
-                storage.all_annotators.setdefault(rule.module_name, {}).setdefault(rule.f_name,
-                                                                                   {"description": rule.description,
-                                                                                    "annotations": [],
-                                                                                    "params": param_dict})
-                storage.all_annotators[rule.module_name][rule.f_name]["annotations"].append((param_value,
-                                                                                             param_value.description))
+                module_annotators = storage.all_annotators.setdefault(rule.module_name, {})
+                annotator_info = module_annotators.get(rule.f_name)
+                if annotator_info is None:
+                    annotator_info = module_annotators[rule.f_name] = {"description": rule.description,
+                                                                       "annotations": [],
+                                                                       "params": param_dict}
+                annotator_info["annotations"].append((param_value, param_value.description))
         # ModelOutput
         elif param_type == ModelOutput:
             rule.configs.update(registry.find_config_variables(param_value.name))
@@ -308,7 +315,7 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
             rule.parameters[param_name] = Corpus(sparv_config.get("metadata.id"))
         # Language
         elif param.annotation == Language:
-            rule.parameters[param_name] = Language(sparv_config.get("metadata.language"))
+            rule.parameters[param_name] = Language(corpus_language)
         # Document
         elif param.annotation == Document:
             rule.docs.append(param_name)
@@ -326,24 +333,17 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
         # Model
         elif param_type == Model:
             if param_value is not None:
-                if param_list:
-                    rule.parameters[param_name] = []
-                    for model in param_value:
-                        if not isinstance(model, Model):
-                            model = Model(param_value)
-                        rule.configs.update(registry.find_config_variables(model.name))
-                        rule.classes.update(registry.find_classes(model.name))
-                        rule.missing_config.update(model.expand_variables(rule.full_name))
-                        rule.inputs.append(model.path)
-                        rule.parameters[param_name].append(Model(str(model.path)))
-                else:
-                    if not isinstance(param_value, Model):
-                        param_value = Model(param_value)
-                    rule.configs.update(registry.find_config_variables(param_value.name))
-                    rule.classes.update(registry.find_classes(param_value.name))
-                    rule.missing_config.update(param_value.expand_variables(rule.full_name))
-                    rule.inputs.append(param_value.path)
-                    rule.parameters[param_name] = Model(str(param_value.path))
+                models = []
+                for model in (param_value if param_list else [param_value]):
+                    if not isinstance(model, Model):
+                        model = Model(model)
+                    rule.configs.update(registry.find_config_variables(model.name))
+                    rule.classes.update(registry.find_classes(model.name))
+                    rule.missing_config.update(model.expand_variables(rule.full_name))
+                    model_path = model.path
+                    rule.inputs.append(model_path)
+                    models.append(Model(str(model_path)))
+                rule.parameters[param_name] = models if param_list else models[0]
         # Binary
         elif param.annotation in (Binary, BinaryDir):
             rule.configs.update(registry.find_config_variables(param.default))
@@ -417,6 +417,7 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
                                                            "es" if len(custom_params) == 1 else "",
                                                            rule.full_name))
 
+    rule.outputs_set = frozenset(rule.outputs)
     storage.all_rules.append(rule)
 
     # Add to rule lists in storage
@@ -480,11 +481,21 @@ def check_ruleorder(storage: SnakeStorage) -> Set[Tuple[RuleStorage, RuleStorage
     """Order rules where necessary and print warning if rule order is missing."""
     ruleorder_pairs = set()
     ordered_rules = set()
+    # Group rules by output, to only compare rules sharing at least one output
+    output_rules = defaultdict(list)
+    for i, rule in enumerate(storage.all_rules):
+        for output in rule.outputs_set:
+            output_rules[output].append(i)
+    candidates = set()
+    for rule_indices in output_rules.values():
+        candidates.update(combinations(rule_indices, 2))
+
     # Find rules that have common outputs and therefore need to be ordered
     rule: RuleStorage
     other_rule: RuleStorage
-    for rule, other_rule in combinations(storage.all_rules, 2):
-        common_outputs = tuple(sorted(set(rule.outputs).intersection(set(other_rule.outputs))))
+    for i, j in sorted(candidates):
+        rule, other_rule = storage.all_rules[i], storage.all_rules[j]
+        common_outputs = tuple(sorted(rule.outputs_set & other_rule.outputs_set))
         if common_outputs:
             # Check if a rule is lacking ruleorder or if two rules have the same order attribute
             if any(i is None for i in [rule.order, other_rule.order]) or rule.order == other_rule.order:
@@ -509,7 +520,7 @@ def get_parameters(rule_params):
     def get_params(wildcards):
         doc = get_doc_value(wildcards, rule_params.annotator)
         # We need to make a copy of the parameters, since the rule might be used for multiple documents
-        _parameters = copy.deepcopy(rule_params.parameters)
+        _parameters = {name: _copy_parameter(value) for name, value in rule_params.parameters.items()}
         _parameters.update({name: Document(doc) for name in rule_params.docs})
 
         # Add document name to annotation and output parameters
@@ -529,7 +540,7 @@ def get_parameters(rule_params):
 
         # Replace wildcards (other than {doc}) in parameters
         for name in rule_params.wildcard_annotations:
-            wcs = re.finditer(r"(?!{doc}){([^}]+)}", str(_parameters[name]))
+            wcs = _WILDCARD_RE.finditer(str(_parameters[name]))
             for wc in wcs:
                 if isinstance(_parameters[name], Base):
                     _parameters[name].name = _parameters[name].name.replace(wc.group(), wildcards.get(wc.group(1)))
@@ -539,6 +550,22 @@ def get_parameters(rule_params):
     return get_params
 
 
+def _copy_parameter(value):
+    """Copy a rule parameter value enough for it to be safely modified for a single document.
+
+    Annotation-like objects are only ever modified by having attributes reassigned, so shallow copies suffice.
+    """
+    if isinstance(value, ExportAnnotations):
+        value_copy = copy.copy(value)
+        value_copy[:] = [(copy.copy(annotation), export_name) for annotation, export_name in value]
+        return value_copy
+    if isinstance(value, (Base, Text)):
+        return copy.copy(value)
+    if isinstance(value, (list, tuple, dict, set)):
+        return copy.deepcopy(value)
+    return value
+
+
 def update_storage(storage, rule):
     """Update info to snake storage with different targets."""
     if rule.exporter:
@@ -562,9 +589,15 @@ def get_source_path() -> str:
 
 def get_annotation_path(annotation, data=False, common=False):
     """Construct a path to an annotation file given a doc and annotation."""
-    if not isinstance(annotation, BaseAnnotation):
-        annotation = BaseAnnotation(annotation)
-    elem, attr = annotation.split()
+    if isinstance(annotation, BaseAnnotation):
+        annotation = annotation.name
+    return _get_annotation_path(annotation, data, common)
+
+
+@lru_cache(maxsize=None)
+def _get_annotation_path(annotation_name, data, common):
+    """Construct a path to an annotation file given an annotation name. Paths are cached since they are immutable."""
+    elem, attr = BaseAnnotation(annotation_name).split()
     path = Path(elem)
 
     if not (data or common):
@@ -578,7 +611,10 @@ def get_annotation_path(annotation, data=False, common=False):
 
 
 def get_source_files(source_files) -> List[str]:
-    """Get list of all available source files."""
+    """Get list of all available source files.
+
+    The source_files list is filled in place the first time, so that the source directory is only listed once.
+    """
     if not source_files:
         if not sparv_config.get("import.importer"):
             raise util.SparvErrorMessage("The config variable 'import.importer' must not be empty.", "sparv")
@@ -589,8 +625,8 @@ def get_source_files(source_files) -> List[str]:
             raise util.SparvErrorMessage(
                 "Could not find the importer '{}'. Make sure the 'import.importer' config value refers to an "
                 "existing importer.".format(sparv_config.get("import.importer")), "sparv")
-        source_files = [f[1][0] for f in snakemake.utils.listfiles(
-            Path(get_source_path(), "{file}." + file_extension))]
+        source_files.extend(f[1][0] for f in snakemake.utils.listfiles(
+            Path(get_source_path(), "{file}." + file_extension)))
     return source_files
 
 
@@ -606,7 +642,7 @@ def get_wildcard_values(config):
 
 def escape_wildcards(s):
     """Escape all wildcards other than {doc}."""
-    return re.sub(r"(?!{doc})({[^}]+})", r"{\1}", str(s))
+    return _ESCAPE_WILDCARD_RE.sub(r"{\1}", str(s))
 
 
 def get_doc_value(wildcards, annotator):
@@ -46,13 +46,15 @@ def csv(doc: Document = Document(),
     # Make csv header
     csv_data = [_make_header(token_name, token_attributes, export_names, delimiter)]
 
+    # Look up the token attribute columns once instead of once per token
+    token_columns = [annotation_dict[token_name].get(attr) for attr in token_attributes]
+
     # Go through spans_dict and add to csv, line by line
     for _pos, instruction, span in span_positions:
         if instruction == "open":
             # Create token line
             if span.name == token_name:
-                csv_data.append(_make_token_line(word_annotation[span.index], token_name, token_attributes,
-                                                 annotation_dict, span.index, delimiter))
+                csv_data.append(_make_token_line(word_annotation[span.index], token_columns, span.index, delimiter))
 
             # Create line with structural annotation
             else:
@@ -80,15 +82,14 @@ def _make_header(token, token_attributes, export_names, delimiter):
     return delimiter.join(line)
 
 
-def _make_token_line(word, token, token_attributes, annotation_dict, index, delimiter):
-    """Create a line with the token and its annotations."""
+def _make_token_line(word, token_columns, index, delimiter):
+    """Create a line with the token and its annotations.
+
+    token_columns holds the value list of every token attribute (or None for missing attributes).
+    """
     line = [word.replace(delimiter, " ")]
-    for attr in token_attributes:
-        if attr not in annotation_dict[token]:
-            attr_str = util.UNDEF
-        else:
-            attr_str = annotation_dict[token][attr][index]
-        line.append(attr_str)
+    for column in token_columns:
+        line.append(column[index] if column is not None else util.UNDEF)
     return delimiter.join(line)
 
 
@@ -4,6 +4,7 @@ import logging
 import os
 import re
 from glob import glob
+from itertools import islice
 from pathlib import Path
 from typing import Optional
 
@@ -14,6 +15,24 @@ from sparv.core import paths
 
 log = logging.getLogger(__name__)
 
+# Translation tables used for escaping values in the VRT output. Control characters (except for line breaks and tabs)
+# are removed in the same pass.
+_ESCAPE_STRUCT_ATTR = str.maketrans({"&": "&amp;", '"': "&quot;", "<": "&lt;", ">": "&gt;"})
+_ESCAPE_WORD = str.maketrans({" ": "_", "&": "&amp;", "<": "&lt;", ">": "&gt;",
+                              **util.CONTROL_CHARACTERS_KEEP_WHITESPACE})
+_ESCAPE_TOKEN_ATTR = str.maketrans({"/": None, **_ESCAPE_WORD})
+
+
+def _compile_needs_escape(table):
+    """Return a search function matching any character that is changed by the translation table."""
+    return re.compile("[%s]" % re.escape("".join(map(chr, table)))).search
+
+
+# Most values contain nothing that needs escaping, and checking for that is much cheaper than translating
+_NEEDS_ESCAPE_STRUCT_ATTR = _compile_needs_escape(_ESCAPE_STRUCT_ATTR)
+_NEEDS_ESCAPE_WORD = _compile_needs_escape(_ESCAPE_WORD)
+_NEEDS_ESCAPE_TOKEN_ATTR = _compile_needs_escape(_ESCAPE_TOKEN_ATTR)
+
 
 @exporter("VRT export", config=[
     Config("cwb.source_annotations",
@@ -49,12 +68,12 @@ def vrt(doc: Document = Document(),
                                                                                 sparv_namespace=sparv_namespace,
                                                                                 source_namespace=source_namespace)
     span_positions, annotation_dict = util.gather_annotations(annotation_list, export_names, doc=doc)
-    vrt_data = create_vrt(span_positions, token.name, word_annotation, token_attributes, annotation_dict,
-                          export_names)
+    vrt_lines = create_vrt(span_positions, token.name, word_annotation, token_attributes, annotation_dict,
+                           export_names)
 
     # Write result to file
     with open(out, "w") as f:
-        f.write(vrt_data)
+        write_vrt(f, vrt_lines)
     log.info("Exported: %s", out)
 
 
@@ -93,15 +112,15 @@ def vrt_scrambled(doc: Document = Document(),
     new_span_positions = util.scramble_spans(span_positions, chunk.name, chunk_order_data)
 
     # Make vrt format
-    vrt_data = create_vrt(new_span_positions, token.name, word_annotation, token_attributes, annotation_dict,
-                          export_names)
+    vrt_lines = create_vrt(new_span_positions, token.name, word_annotation, token_attributes, annotation_dict,
+                           export_names)
 
     # Create export dir
     os.makedirs(os.path.dirname(out), exist_ok=True)
 
     # Write result to file
     with open(out, "w") as f:
-        f.write(vrt_data)
+        write_vrt(f, vrt_lines)
     log.info("Exported: %s", out)
 
 
@@ -304,58 +323,94 @@ def cwb_align(corpus, other, link, aligndir="annotations/align", bin_path="",
 
 
 def create_vrt(span_positions, token_name: str, word_annotation, token_attributes, annotation_dict, export_names):
-    """Go through span_positions and create vrt, line by line."""
-    vrt_lines = []
+    """Go through span_positions and yield the vrt, line by line."""
+    # Look up the token attribute columns once instead of once per token
+    token_columns = get_token_columns(token_name, token_attributes, annotation_dict)
+    # Escaped structural element names, closing tags and attribute columns, keyed by annotation name
+    cwb_span_names = {}
+    close_tags = {}
+    struct_columns = {}
     for _pos, instruction, span in span_positions:
         # Create token line
         if span.name == token_name and instruction == "open":
-            vrt_lines.append(make_token_line(word_annotation[span.index], token_name, token_attributes, annotation_dict,
-                                             span.index))
+            yield make_token_line(word_annotation[span.index], token_columns, span.index)
 
         # Create line with structural annotation
         elif span.name != token_name:
-            cwb_span_name = cwb_escape(span.export)
+            cwb_span_name = cwb_span_names.get(span.name)
+            if cwb_span_name is None:
+                cwb_span_name = cwb_span_names[span.name] = cwb_escape(span.export)
+                close_tags[span.name] = f"</{cwb_span_name}>"
+                struct_columns[span.name] = get_struct_columns(span.name, annotation_dict, export_names)
             # Open structural element
             if instruction == "open":
-                attrs = make_attr_str(span.name, annotation_dict, export_names, span.index)
+                attrs = make_attr_str(struct_columns[span.name], span.index)
                 if attrs:
-                    vrt_lines.append("<%s %s>" % (cwb_span_name, attrs))
+                    yield f"<{cwb_span_name} {attrs}>"
                 else:
-                    vrt_lines.append("<%s>" % cwb_span_name)
+                    yield f"<{cwb_span_name}>"
             # Close element
             else:
-                vrt_lines.append("</%s>" % cwb_span_name)
+                yield close_tags[span.name]
+
 
-    return "\n".join(vrt_lines)
+def write_vrt(f, vrt_lines, batch_size: int = 10000):
+    """Write vrt_lines to the file object f, separated by line breaks.
+
+    Lines are joined and written in batches of batch_size lines, to keep the number of write calls down without
+    having to keep the whole file in memory.
+    """
+    vrt_lines = iter(vrt_lines)
+    batch = list(islice(vrt_lines, batch_size))
+    if batch:
+        f.write("\n".join(batch))
+    while True:
+        batch = list(islice(vrt_lines, batch_size))
+        if not batch:
+            break
+        f.write("\n")
+        f.write("\n".join(batch))
 
 
-def make_attr_str(annotation, annotation_dict, export_names, index):
+def get_struct_columns(annotation, annotation_dict, export_names):
+    """Return a list of (escaped export name, value list) tuples for the attributes of a struct annotation."""
+    return [(cwb_escape(export_names.get(":".join([annotation, name]), name)), annot)
+            for name, annot in annotation_dict[annotation].items()]
+
+
+def make_attr_str(struct_columns, index):
     """Create a string with attributes and values for a struct element."""
     attrs = []
-    for name, annot in annotation_dict[annotation].items():
-        export_name = export_names.get(":".join([annotation, name]), name)
-        export_name = cwb_escape(export_name)
+    for export_name, annot in struct_columns:
+        value = annot[index]
         # Escape special characters in value
-        value = annot[index].replace("&", "&amp;").replace('"', "&quot;").replace("<", "&lt;").replace(">", "&gt;")
-        attrs.append('%s="%s"' % (export_name, value))
+        if _NEEDS_ESCAPE_STRUCT_ATTR(value):
+            value = value.translate(_ESCAPE_STRUCT_ATTR)
+        attrs.append(f'{export_name}="{value}"')
     return " ".join(attrs)
 
 
-def make_token_line(word, token, token_attributes, annotation_dict, index):
+def get_token_columns(token_name, token_attributes, annotation_dict):
+    """Return a list with the value list of every token attribute, in column order.
+
+    Attributes missing from annotation_dict are represented by None.
+    """
+    token_dict = annotation_dict[token_name]
+    return [token_dict.get(attr) for attr in token_attributes]
+
+
+def make_token_line(word, token_columns, index):
     """Create a string with the token and its annotations.
 
     Whitespace and / need to be replaced for CQP parsing to work. / is only allowed in the word itself.
     """
-    line = [word.replace(" ", "_").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")]
-    for attr in token_attributes:
-        if attr not in annotation_dict[token]:
-            attr_str = util.UNDEF
-        else:
-            attr_str = annotation_dict[token][attr][index]
-        line.append(
-            attr_str.replace(" ", "_").replace("/", "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"))
-    line = "\t".join(line)
-    return util.remove_control_characters(line)
+    line = [word.translate(_ESCAPE_WORD) if _NEEDS_ESCAPE_WORD(word) else word]
+    for column in token_columns:
+        attr_str = column[index] if column is not None else util.UNDEF
+        if _NEEDS_ESCAPE_TOKEN_ATTR(attr_str):
+            attr_str = attr_str.translate(_ESCAPE_TOKEN_ATTR)
+        line.append(attr_str)
+    return "\t".join(line)
 
 
 def parse_structural_attributes(structural_atts):
@@ -389,7 +444,7 @@ def parse_structural_attributes(structural_atts):
 
 def cwb_escape(inname):
     """Replace dots with "-" for CWB compatibility."""
-    return re.sub(r"\.", "-", inname)
+    return inname.replace(".", "-")
 
 
 def truncateset(string, maxlength=4095, delimiter="|", affix="|", encoding="UTF-8"):
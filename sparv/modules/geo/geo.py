@@ -1,14 +1,19 @@
 """Annotate geographical features."""
 
+import gc
 import logging
 import pickle
 from collections import defaultdict
+from operator import itemgetter
 
 import sparv.util as util
 from sparv import Annotation, Config, Model, ModelOutput, Output, Wildcard, annotator, modelbuilder
 
 log = logging.getLogger(__name__)
 
+# Geo models already loaded in this process, by model path and languages
+_loaded_models = {}
+
 
 @annotator("Annotate {chunk} with location data, based on locations contained within the text", language=["swe"],
            config=[
@@ -31,8 +36,9 @@ def contextual(out: Output = Output("{chunk}:geo.geo_context", description="Geog
     """
     model = load_model(model, language=language)
 
-    ne_type_annotation = list(ne_type.read())
-    ne_subtype_annotation = list(ne_subtype.read())
+    # Only populated places are used
+    is_place = [ne_type_value == "LOC" and "PPL" in ne_subtype_value
+                for ne_type_value, ne_subtype_value in zip(ne_type.read(), ne_subtype.read())]
     ne_name_annotation = list(ne_name.read())
 
     children_context_chunk, _orphans = context.get_children(chunk)
@@ -40,28 +46,32 @@ def contextual(out: Output = Output("{chunk}:geo.geo_context", description="Geog
 
     out_annotation = chunk.create_empty_attribute()
 
+    # Normalized names and their location data, since the same names tend to occur many times
+    name_lookups = {}
+
     for chunks in children_context_chunk:
         all_locations = []  # TODO: Maybe not needed for anything?
         context_locations = []
-        chunk_locations = defaultdict(list)
 
         for ch in chunks:
+            chunk_locations = []
             for n in children_chunk_ne[ch]:
-                if ne_type_annotation[n] == "LOC" and "PPL" in ne_subtype_annotation[n]:
-                    location_text = ne_name_annotation[n].replace("\n", " ").replace("  ", " ")
-                    location_data = model.get(location_text.lower())
+                if is_place[n]:
+                    name = ne_name_annotation[n]
+                    if name not in name_lookups:
+                        location_text = name.replace("\n", " ").replace("  ", " ")
+                        location_data = model.get(location_text.lower())
+                        name_lookups[name] = (location_text, list(location_data) if location_data else None)
+                    location_text, location_data = name_lookups[name]
                     if location_data:
-                        all_locations.append((location_text, list(location_data)))
-                        context_locations.append((location_text, list(location_data)))
-                        chunk_locations[ch].append((location_text, list(location_data)))
+                        all_locations.append((location_text, location_data))
+                        context_locations.append((location_text, location_data))
+                        chunk_locations.append((location_text, location_data))
                     else:
                         pass
                         # log.info("No location found for %s" % ne_name_annotation[n].replace("%", "%%"))
 
-        chunk_locations = most_populous(chunk_locations)
-
-        for c in chunks:
-            out_annotation[c] = _format_location(chunk_locations.get(c, ()))
+            out_annotation[ch] = _format_location(_most_populous(chunk_locations))
 
     out.write(out_annotation)
 
@@ -144,32 +154,33 @@ def pickle_model(geonames, alternative_names, out):
     log.info("Reading geonames: %s", geonames.name)
     result = {}
 
-    model_file = geonames.read()
-    for line in model_file.split("\n"):
-        if line.strip():
-            geonameid, name, _, _, latitude, longitude, _feature_class, _feature_code, \
-                country, _, _admin1, _admin2, _admin3, _admin4, population, _, _, _, _ = line.split("\t")
-
-            result[geonameid] = {
-                "name": name,
-                "alternative_names": {},
-                "latitude": latitude,
-                "longitude": longitude,
-                "country": country,
-                "population": population
-            }
+    # Lines are only split on "\n", since other line break characters may occur within fields
+    with open(geonames.path, encoding="utf-8", newline="\n") as model_file:
+        for line in model_file:
+            if line.strip():
+                geonameid, name, _, _, latitude, longitude, _feature_class, _feature_code, \
+                    country, _, _admin1, _admin2, _admin3, _admin4, population, _, _, _, _ = \
+                    line.rstrip("\n").split("\t")
+
+                result[geonameid] = {
+                    "name": name,
+                    "alternative_names": {},
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "country": country,
+                    "population": population
+                }
 
     # Parse file with alternative names of locations, paired with language codes
     log.info("Reading alternative names: %s", alternative_names.name)
 
-    model_file = alternative_names.read()
-    for line in model_file.split("\n"):
-        if line.strip():
-            _altid, geonameid, isolanguage, altname, _is_preferred_name, _is_short_name, \
-                _is_colloquial, _is_historic = line.split("\t")
-            if geonameid in result:
-                result[geonameid]["alternative_names"].setdefault(isolanguage, [])
-                result[geonameid]["alternative_names"][isolanguage].append(altname)
+    with open(alternative_names.path, encoding="utf-8", newline="\n") as model_file:
+        for line in model_file:
+            if line.strip():
+                _altid, geonameid, isolanguage, altname, _is_preferred_name, _is_short_name, \
+                    _is_colloquial, _is_historic = line.rstrip("\n").split("\t")
+                if geonameid in result:
+                    result[geonameid]["alternative_names"].setdefault(isolanguage, []).append(altname)
 
     log.info("Saving geomodel in Pickle format")
     out.write_pickle(result)
@@ -181,38 +192,58 @@ def pickle_model(geonames, alternative_names, out):
 
 
 def load_model(model: Model, language=()):
-    """Load geo model and return as dict."""
+    """Load geo model and return as dict.
+
+    The model is only read once per process for each combination of model and languages.
+    """
+    language = frozenset(language)
+    model_key = (model.path, language)
+    if model_key in _loaded_models:
+        return _loaded_models[model_key]
+
     log.info("Reading geomodel: %s", model)
-    with open(model.path, "rb") as infile:
-        m = pickle.load(infile)
-
-    result = defaultdict(set)
-    for _geonameid, l in list(m.items()):
-        result[l["name"].lower()].add((l["name"], l["latitude"], l["longitude"], l["country"], l["population"]))
-        for lang in l["alternative_names"]:
-            if lang in language or not language:
-                for altname in l["alternative_names"][lang]:
-                    result[altname.lower()].add(
-                        (l["name"], l["latitude"], l["longitude"], l["country"], l["population"]))
+    # The model consists of millions of small containers, none of them cyclic, so pause the garbage collector
+    # instead of letting it repeatedly traverse them while they are being created
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(model.path, "rb") as infile:
+            m = pickle.load(infile)
+
+        result = defaultdict(set)
+        for l in m.values():
+            # Locations are stored preformatted for output, together with their population. The same tuple is
+            # shared by the location's main name and all its alternative names.
+            location = (";".join((l["name"], l["country"], l["latitude"], l["longitude"])), int(l["population"]))
+            result[l["name"].lower()].add(location)
+            for lang, altnames in l["alternative_names"].items():
+                if lang in language or not language:
+                    for altname in altnames:
+                        result[altname.lower()].add(location)
+    finally:
+        if gc_enabled:
+            gc.enable()
 
     log.info("Read %d geographical names", len(result))
 
+    _loaded_models[model_key] = result
     return result
 
 
+# Get the population from a location in the model
+_population = itemgetter(1)
+
+
 def most_populous(locations):
     """Disambiguate locations by only keeping the most populous ones."""
-    new_locations = {}
+    return {chunk: _most_populous(chunk_locations) for chunk, chunk_locations in locations.items()}
 
-    for chunk in locations:
-        new_locations[chunk] = set()
 
-        for loc in locations[chunk]:
-            biggest = (loc[0], sorted(loc[1], key=lambda x: -int(x[-1]))[0])
-            new_locations[chunk].add(biggest)
-    return new_locations
+def _most_populous(locations):
+    """Disambiguate a list of locations for one chunk, returning a set with the most populous place for each."""
+    return set((loc[0], max(loc[1], key=_population)) for loc in locations)
 
 
 def _format_location(location_data):
     """Format location as city;country;latitude;longitude."""
-    return util.cwbset(";".join((y[0], y[3], y[1], y[2])) for x, y in location_data)
+    return util.cwbset(y[0] for x, y in location_data)
@@ -5,6 +5,9 @@ from typing import List, Optional
 
 from sparv import Annotation, Config, Output, Text, Wildcard, annotator, util
 
+# Escapes for whitespace characters in head and tail annotations
+_WHITESPACE_ESCAPES = str.maketrans({" ": "\\s", "\n": "\\n", "\t": "\\t"})
+
 
 @annotator("Text value of a span (usually a token)", config=[
     Config("misc.keep_formatting_chars", default=False,
@@ -18,19 +21,23 @@ def text_spans(text: Text = Text(),
     corpus_text = text.read()
     if isinstance(chunk, (str, Annotation)):
         chunk = chunk.read_spans()
-    out_annotation = []
-    for span in chunk:
-        token = corpus_text[span[0]:span[1]]
-        if not keep_formatting_chars:
-            new_token = util.remove_formatting_characters(token)
-            # If this token consists entirely of formatting characters, don't remove them. Empty tokens are bad!
-            if new_token:
-                token = new_token
-        out_annotation.append(token)
+
+    def get_tokens():
+        """Yield the text of each span, one at a time."""
+        for span in chunk:
+            token = corpus_text[span[0]:span[1]]
+            if not keep_formatting_chars:
+                new_token = util.remove_formatting_characters(token)
+                # If this token consists entirely of formatting characters, don't remove them. Empty tokens are bad!
+                if new_token:
+                    token = new_token
+            yield token
+
     if out:
-        out.write(out_annotation)
+        # Stream the tokens directly to file instead of keeping them all in memory
+        out.write(get_tokens())
     else:
-        return out_annotation
+        return list(get_tokens())
 
 
 @annotator("Head and tail whitespace characters for tokens")
@@ -41,7 +48,7 @@ def text_headtail(text: Text = Text(),
     """Extract "head" and "tail" whitespace characters for tokens."""
     def escape(t):
         """Escape whitespace characters."""
-        return t.replace(" ", "\\s").replace("\n", "\\n").replace("\t", "\\t")
+        return t.translate(_WHITESPACE_ESCAPES)
 
     out_head_annotation = chunk.create_empty_attribute()
     out_tail_annotation = chunk.create_empty_attribute()
@@ -85,7 +92,7 @@ def translate_tag(out: Output,
     """
     if isinstance(mapping, str):
         mapping = util.tagsets.mappings[mapping]
-    out.write((mapping.get(t, t) for t in tag.read()))
+    out.write(mapping.get(t, t) for t in tag.read())
 
 
 @annotator("Convert SUC POS tags to UPOS", language=["swe"])
@@ -163,7 +170,9 @@ def select(out: Output,
     """
     if isinstance(index, str):
         index = int(index)
-    out.write(value.split(separator)[index] for value in annotation.read())
+    # Don't split more than needed (not possible when counting from the end)
+    maxsplit = index + 1 if index >= 0 else -1
+    out.write(value.split(separator, maxsplit)[index] for value in annotation.read())
 
 
 @annotator("Create an annotation with a constant value")
@@ -6,14 +6,30 @@ Please download, unzip and place contents inside sparv-pipeline/bin/stanford_par
 License for Stanford CoreNLP: GPL2 https://www.gnu.org/licenses/old-licenses/gpl-2.0.html
 """
 
+import io
 import re
+import threading
+from collections import namedtuple
 
 import sparv.util as util
 from sparv import Annotation, BinaryDir, Config, Language, Output, Text, annotator
 
+# Arguments for the CoreNLP pipeline
+_CORENLP_ARGS = ("-annotators", "tokenize,ssplit,pos,lemma,depparse,ner",
+                 "-ssplit.newlineIsSentenceBreak", "two",
+                 "-outputFormat", "conll")
+
+# Separator between text elements in the parser input, ensuring a sentence break
+_TEXT_SEPARATOR = "\n\n"
+
+# Matches the whitespace (if any) at a given position, used to skip whitespace between tokens during alignment
+_skip_whitespace = re.compile(r"\s*").match
+
 
 @annotator("Parse and annotate with Stanford Parser", language=["eng"], config=[
-    Config("stanford.bin", default="stanford_parser", description="Path to directory containing Stanford executables")
+    Config("stanford.bin", default="stanford_parser", description="Path to directory containing Stanford executables"),
+    Config("stanford.threads", default=1, description="Number of threads CoreNLP uses for tagging and named "
+                                                      "entity recognition of the sentences in a document")
 ])
 def annotate(corpus_text: Text = Text(),
              lang: Language = Language(),
@@ -32,94 +48,129 @@ def annotate(corpus_text: Text = Text(),
                                          description="Dependency relations to the head"),
              out_dephead_ref: Output = Output("<token>:stanford.dephead_ref", cls="token:dephead_ref",
                                               description="Sentence-relative positions of the dependency heads"),
-             binary: BinaryDir = BinaryDir("[stanford.bin]")):
+             binary: BinaryDir = BinaryDir("[stanford.bin]"),
+             threads: int = Config("stanford.threads")):
     """Use Stanford Parser to parse and annotate text."""
-    args = ["-cp", binary + "/*", "edu.stanford.nlp.pipeline.StanfordCoreNLP",
-            "-annotators", "tokenize,ssplit,pos,lemma,depparse,ner",
-            "-outputFormat", "conll"]
-    process = util.system.call_binary("java", arguments=args, return_command=True)
+    args = ["-cp", binary + "/*", "edu.stanford.nlp.pipeline.StanfordCoreNLP", *_CORENLP_ARGS,
+            "-nthreads", str(threads)]
 
-    # Read corpus_text and text_spans
+    # Read corpus_text and text_spans, skipping text elements without any text to parse
     text_data = corpus_text.read()
-    text_spans = text.read_spans()
+    text_spans = [text_span for text_span in text.read_spans() if text_data[text_span[0]:text_span[1]].strip()]
 
     sentence_segments = []
     all_tokens = []
-
-    # Go through text elements and parse them with Stanford Parser
-    for text_span in text_spans:
-        inputtext = text_data[text_span[0]:text_span[1]]
-        stdout, _ = process.communicate(inputtext.encode(util.UTF8))
-        processed_sentences = _parse_output(stdout.decode(util.UTF8), lang)
-
-        # Go through output and try to match tokens with input text to get correct spans
-        index_counter = text_span[0]
-        for sentence in processed_sentences:
-            for token in sentence:
-                all_tokens.append(token)
-                # Get token span
-                match = re.match(r"\s*(%s)" % re.escape(token.word), inputtext)
-                span = match.span(1)
-                token.start = span[0] + index_counter
-                token.end = span[1] + index_counter
-                # Forward inputtext
-                inputtext = inputtext[span[1]:]
-                index_counter += span[1]
-            # Extract sentence span for current sentence
-            sentence_segments.append((sentence[0].start, sentence[-1].end))
+    token_spans = []
+
+    # Parse all text elements with a single Stanford Parser process. The texts are separated by blank lines, which
+    # CoreNLP is set to treat as sentence breaks, so that no sentence spans more than one text.
+    if text_spans:
+        inputtexts = (text_data[text_span[0]:text_span[1]] for text_span in text_spans)
+        processed_sentences = _run_parser(args, _TEXT_SEPARATOR.join(inputtexts), lang)
+    else:
+        processed_sentences = ()
+
+    # Go through output and try to match tokens with input text to get correct spans
+    remaining_spans = iter(text_spans)
+    cursor = span_end = 0
+    for sentence in processed_sentences:
+        # Move on to the next text element when all tokens of the current one have been found
+        while True:
+            cursor = _skip_whitespace(text_data, cursor, span_end).end()
+            if cursor < span_end:
+                break
+            next_span = next(remaining_spans, None)
+            if next_span is None:
+                raise util.SparvErrorMessage("Could not align the output from Stanford Parser with the source text: "
+                                             "there are more sentences in the output than text to match them with.")
+            cursor, span_end = next_span
+        for token in sentence:
+            # Get token span by skipping any whitespace before the token
+            word = token.word
+            start = _skip_whitespace(text_data, cursor, span_end).end()
+            if not text_data.startswith(word, start, span_end):
+                raise util.SparvErrorMessage(f"Could not find the token '{word}' from Stanford Parser in the "
+                                             "source text.")
+            cursor = start + len(word)
+            token_spans.append((start, cursor))
+        all_tokens.extend(sentence)
+        # Extract sentence span for current sentence
+        sentence_segments.append((token_spans[-len(sentence)][0], token_spans[-1][1]))
 
     # Write annotations
     out_sentence.write(sentence_segments)
-    out_token.write([(t.start, t.end) for t in all_tokens])
-    out_ref.write([t.ref for t in all_tokens])
-    out_word.write([t.word for t in all_tokens])
-    out_baseform.write([t.baseform for t in all_tokens])
-    out_upos.write([t.upos for t in all_tokens])
-    out_pos.write([t.pos for t in all_tokens])
-    out_ne.write([t.ne for t in all_tokens])
-    out_dephead_ref.write([t.dephead_ref for t in all_tokens])
-    out_deprel.write([t.deprel for t in all_tokens])
+    out_token.write(token_spans)
+    # Transpose the tokens into one sequence of values per annotation
+    columns = Token._make(zip(*all_tokens)) if all_tokens else Token._make([()] * len(Token._fields))
+    out_ref.write(columns.ref)
+    out_word.write(columns.word)
+    out_baseform.write(columns.baseform)
+    out_upos.write(columns.upos)
+    out_pos.write(columns.pos)
+    out_ne.write(columns.ne)
+    out_dephead_ref.write(columns.dephead_ref)
+    out_deprel.write(columns.deprel)
+
+
+def _run_parser(args, inputtext, lang):
+    """Run the Stanford Parser on inputtext, yielding the parsed sentences as they are output."""
+    process = util.system.call_binary("java", arguments=args, return_command=True)
+    # The input is written and the error output read by separate threads, so that the parsed output can be read and
+    # processed while the parser is still running, without any of the pipes blocking.
+    feeder = threading.Thread(target=_feed, args=(io.TextIOWrapper(process.stdin, encoding=util.UTF8), inputtext),
+                              daemon=True)
+    feeder.start()
+    stderr = []
+    stderr_reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    try:
+        yield from _parse_output(io.TextIOWrapper(process.stdout, encoding=util.UTF8), lang)
+        feeder.join()
+        stderr_reader.join()
+        process.wait()
+    finally:
+        # Stop the parser if we didn't get to the end, e.g. because the output could not be aligned with the text
+        if process.returncode is None:
+            process.kill()
+            process.wait()
+    if process.returncode:
+        raise util.SparvErrorMessage(f"Stanford Parser exited with error code {process.returncode}:\n"
+                                     + stderr[0].decode(util.UTF8, errors="replace"))
+
+
+def _feed(stdin, data):
+    """Write data to the parser's stdin and close it."""
+    try:
+        with stdin:
+            stdin.write(data)
+    except BrokenPipeError:
+        # The parser has exited before reading all input, which is reported by _run_parser
+        pass
 
 
 def _parse_output(stdout, lang):
-    """Parse the conll format output from the Standford Parser."""
-    sentences = []
+    """Parse the conll format output from the Standford Parser, yielding one sentence at a time."""
     sentence = []
-    for line in stdout.split("\n"):
+    upos_tags = {}  # Cache for POS to UPOS conversions, since there are only a few distinct POS tags
+    for line in stdout:
         # Empty lines == new sentence
-        if not line.strip():
+        if line.isspace():
             if sentence:
-                sentences.append(sentence)
+                yield sentence
                 sentence = []
         # Create new word with attributes
         else:
-            fields = line.split("\t")
-            ref = fields[0]
-            word = fields[1]
-            lemma = fields[2]
-            pos = fields[3]
-            upos = util.tagsets.pos_to_upos(pos, lang, "Penn")
-            named_entity = fields[4] if fields[4] != "O" else ""  # O = empty name tag
-            deprel = fields[6]
-            dephead_ref = fields[5] if fields[4] != "0" else ""  # 0 = empty dephead
+            ref, word, lemma, pos, ne, dephead, deprel = line.rstrip("\n").split("\t", 7)[:7]
+            upos = upos_tags.get(pos)
+            if upos is None:
+                upos = upos_tags[pos] = util.tagsets.pos_to_upos(pos, lang, "Penn")
+            named_entity = "" if ne == "O" else ne  # O = empty name tag
+            dephead_ref = "" if dephead == "0" else dephead  # 0 = empty dephead
             token = Token(ref, word, pos, upos, lemma, named_entity, dephead_ref, deprel)
             sentence.append(token)
+    if sentence:
+        yield sentence
 
-    return sentences
-
-
-class Token:
-    """Object to store annotation information for a token."""
 
-    def __init__(self, ref, word, pos, upos, baseform, ne, dephead_ref, deprel, start=-1, end=-1):
-        """Set attributes."""
-        self.ref = ref
-        self.word = word
-        self.pos = pos
-        self.upos = upos
-        self.baseform = baseform
-        self.ne = ne
-        self.dephead_ref = dephead_ref
-        self.deprel = deprel
-        self.start = start
-        self.end = end
+# Annotations for a token. Token spans are kept separately, since they are only known after alignment.
+Token = namedtuple("Token", "ref word pos upos baseform ne dephead_ref deprel")
@@ -13,15 +13,15 @@ Docstring testing:
 > doctest.testmod(verbose=False)
 """
 
+import contextlib
 import itertools as it
 import json
 import logging
+import os
 import sys
 import tempfile
-from collections import Counter, OrderedDict, defaultdict, namedtuple
-
-import pylibvw
-from vowpalwabbit import pyvw
+import threading
+from collections import Counter, OrderedDict, defaultdict, deque, namedtuple
 
 import sparv.util as util
 from sparv import Annotation, Config, Document, Model, ModelOutput, Output, annotator, modelbuilder
@@ -82,11 +82,11 @@ def word_weights(doc: str = Document,
 @annotator("Predict a structural attribute", config=[
            Config("vw_topic_modelling.model", default="vw_topic_modelling/?.model"),
            Config("vw_topic_modelling.modeljson", default="vw_topic_modelling/?.model.json")])
-def predict(doc: str = Document,
+def predict(order,
+            struct,
+            doc: str = Document,
             model: str = Model("[vw_topic_modelling.model]"),
             modeljson: str = Model("[vw_topic_modelling.modeljson]"),
-            order,
-            struct,
             parent: str = Annotation("{chunk}"),
             word: str = Annotation("<token:word>"),
             out: str = Output("{chunk}:vw_topic_modelling.prediction", description="Predicted attributes"),
@@ -100,7 +100,7 @@ def predict(doc: str = Document,
     data = (
         Example(None, text.words, text.span)
         for text in texts([(order, struct, parent, word, pos)],
-                          map_label=lambda _: "?",
+                          map_label=_unknown_label,
                           min_word_length=m_json["min_word_length"],
                           banned_pos=m_json["banned_pos"])
     )
@@ -124,30 +124,28 @@ def predict(doc: str = Document,
 
 
 def _make_label_map(label_map_json):
+    """Return a function mapping labels according to label_map_json, or None if labels should be kept as they are."""
+    # The label map needs to be picklable, since it is sent to the worker processes in texts()
     if label_map_json:
         with open(label_map_json, "r") as fp:
             d = json.load(fp)
-        return lambda label: d.get(label, None)
+        return d.get
     else:
-        return lambda label: label
+        return None
+
+
+def _unknown_label(_label):
+    return "?"
 
 
 def _take(bound, xs):
-    if bound:
-        i = 0
-        for x in xs:
-            i += 1
-            if i >= bound:
-                break
-            yield x
-    else:
-        for x in xs:
-            yield x
+    """Return the first bound elements of xs, or all of them if bound is not set."""
+    return it.islice(xs, bound) if bound else xs
 
 
 @modelbuilder("Predict a structural attribute")
-def train(doc: str = Document,
-          file_list,
+def train(file_list,
+          doc: str = Document,
           modelfile: str = ModelOutput("vw_topic_modelling/?.model"),
           jsonfile: str = ModelOutput("vw_topic_modelling/?.model.json"),
           dry_run_labels: bool = False,
@@ -175,12 +173,12 @@ def train(doc: str = Document,
     min_word_length = int(min_word_length) if min_word_length else 0
 
     # Look at the structs annotations to get the labels and their distribution:
-    _, structs, _, _, _ = list(zip(*order_struct_parent_word_pos))
+    _, structs, _, _, _ = zip(*order_struct_parent_word_pos)
     # TODO: skip labels with very low occurrences
-    labels = Counter(map_label(label)
-                     for annotfile in structs
-                     for label in util.read_annotation(doc, annotfile)
-                     if map_label(label))
+    all_labels = it.chain.from_iterable(util.read_annotation(doc, annotfile) for annotfile in structs)
+    if map_label:
+        all_labels = map(map_label, all_labels)
+    labels = Counter(filter(None, all_labels))
     N = sum(labels.values())
     if bound:
         bound = int(bound)
@@ -188,11 +186,12 @@ def train(doc: str = Document,
     k = len(labels)
     label_to_index = {}
     index_to_label = {}
-    answer = {}
-    for i, (label, occurences) in enumerate(iter(list(labels.items())), start=1):
-        w = float(N) / occurences
+    # Label prefixes for the training examples, indexed by label index (which starts at 1)
+    answer = [None]
+    for i, (label, occurences) in enumerate(labels.items(), start=1):
+        w = N / occurences
         log.info(f"{label}: occurences: {occurences}, weight: {w}")
-        answer[label] = ("%s:%s | " % (i, w)).encode()
+        answer.append(("%s:%s | " % (i, w)).encode())
         label_to_index[label] = i
         index_to_label[i] = label
 
@@ -203,8 +202,17 @@ def train(doc: str = Document,
         log.info(f"texts: {N}, labels: {k}")
         sys.exit()
 
+    # Tokenize the texts only once and spool them, to be read by both the training and the evaluation pass
+    spool = tempfile.SpooledTemporaryFile(max_size=512 * 1024 * 1024)
+    for text in _take(bound, texts(order_struct_parent_word_pos, map_label, min_word_length, banned_pos)):
+        spool.write(b"%d %s\n" % (label_to_index[text.label], text.words))
+
     def itertexts():
-        return _take(bound, texts(order_struct_parent_word_pos, map_label, min_word_length, banned_pos))
+        """Yield (label index, words) tuples from the spool."""
+        spool.seek(0)
+        for line in spool:
+            index, _, words = line.rstrip(b"\n").partition(b" ")
+            yield int(index), words
 
     # Train model
     args = ["--oaa", str(k),
@@ -213,24 +221,23 @@ def train(doc: str = Document,
             "--bit_precision", "24",
             "--final_regressor", modelfile]
     data = (
-        Example(answer[text.label], text.words)
-        for text in every(10, itertexts(), invert=True)
+        Example(answer[index], words)
+        for index, words in every(10, itertexts(), invert=True)
     )
     vw_train(args, data)
 
     # Performance evaluation
+    # This needs a second vw process: the training process makes several passes over its cached input, so the
+    # evaluation examples can't be appended to it, and the vw binary has no way of switching to test mode midway
     args = ["--initial_regressor", modelfile]
-    target = []
-
-    def data_iterator():
-        for text in every(10, itertexts()):
-            target.append(label_to_index[text.label])
-            yield Example(None, text.words)
-
-    predicted = [int(s) for s, _tag in vw_predict(args, data_iterator())]
-    N_eval = len(predicted)
-
-    assert len(predicted) == len(target)
+    # Use the target label index as tag, and count (target, predicted) pairs as the predictions are streamed
+    data = (
+        Example(None, words, index)
+        for index, words in every(10, itertexts())
+    )
+    pairs = Counter((target, predicted) for predicted, target in vw_predict(args, data))
+    N_eval = sum(pairs.values())
+    spool.close()
 
     order = list(range(1, 1 + k))
     info = dict(
@@ -243,8 +250,8 @@ def train(doc: str = Document,
         N_eval=N_eval,
         stats={index_to_label[i]: p.as_dict()
                for i, p in
-               list(multiclass_performance(target, predicted).items())},
-        confusion_matrix=confusion_matrix(target, predicted, order))
+               multiclass_performance_from_pairs(pairs, order).items()},
+        confusion_matrix=confusion_matrix_from_pairs(pairs, order))
     with open(jsonfile, "w") as f:
         json.dump(info, f, sort_keys=True, indent=2)
     log.info(f"Wrote {jsonfile}")
@@ -257,10 +264,10 @@ def make_testdata(corpus_desc="abcd abcd dcba cbad", docs=1000):
     # make = lambda s: (s, triangulate(s))
     corpora = [(s, tuple(triangulate(s))) for s in corpus_desc.split()]
     for _ in range(n_docs):
-        _corpus, freq = random.choice(corpora)
-        print("<text label="" + corpus + "">")
+        corpus, freq = random.choice(corpora)
+        print('<text label="' + corpus + '">')
         n_words = random.randint(12, 39)
-        print(" ".join(random.choice(freq) for _ in range(n_words)))
+        print(" ".join(random.choices(freq, k=n_words)))
         print("</text>")
 
 
@@ -273,36 +280,81 @@ def texts(order_struct_parent_word_pos, map_label, min_word_length, banned_pos):
 
     The annotations contain token order, the structural attribute (like a label),
     its parenting of the words, and the words themselves.
+
+    Several annotation tuples (as when training) are processed in parallel, but the texts are yielded in order.
+    Only as many tuples as there are workers are processed ahead of the texts that have been consumed, so that
+    no more work is done than needed when only the first texts are used.
+    A single annotation tuple (as when predicting one document) is processed in the current process.
     """
     X = 0
     S = 0
     banned_pos = (banned_pos or "").split()
-    for order, struct, parent, word, pos in order_struct_parent_word_pos:
-        x = 0
-        s = 0
-        log.info(f"Processing {struct} {parent} {word}")
-        # TODO: needs re-writing! cwb.tokens_and_vrt and cwb.vrt_iterate don't exist anymore
-        tokens, vrt = cwb.tokens_and_vrt(order, [(struct, parent)], [word] + ([pos] if pos else []))
-        for (label, span), cols in cwb.vrt_iterate(tokens, vrt):
-            words = b" ".join(vw_normalize(col[0])
-                              for col in cols
-                              if len(col[0]) >= min_word_length
-                              if not pos or col[1] not in banned_pos)
-            mapped_label = map_label(label)
-            if mapped_label:
-                x += 1
-                yield Text(mapped_label, span, words)
-            else:
-                s += 1
-        log.info(f"Texts from {struct}: {x} (skipped: {s})")
-        X += x
-        S += s
+    with contextlib.ExitStack() as stack:
+        if len(order_struct_parent_word_pos) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            workers = os.cpu_count() or 1
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = _bounded_map(executor, workers, _annotation_texts, order_struct_parent_word_pos, map_label,
+                                   min_word_length, banned_pos)
+            # Cancel the tuples not yet processed (before the executor waits for them) if we stop early
+            stack.callback(results.close)
+        else:
+            results = map(_annotation_texts, order_struct_parent_word_pos, it.repeat(map_label),
+                          it.repeat(min_word_length), it.repeat(banned_pos))
+        for (_order, struct, _parent, _word, _pos), (file_texts, s) in zip(order_struct_parent_word_pos, results):
+            x = len(file_texts)
+            log.info(f"Texts from {struct}: {x} (skipped: {s})")
+            yield from file_texts
+            X += x
+            S += s
     log.info(f"Total texts: {X} (skipped: {S})")
 
 
+def _bounded_map(executor, window, fn, items, *args):
+    """Yield fn(item, *args) for every item in order, with at most window calls submitted to the executor at once."""
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fn, item, *args))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _annotation_texts(order_struct_parent_word_pos, map_label, min_word_length, banned_pos):
+    """Get the texts from one 5-tuple of annotations, and the number of skipped texts."""
+    order, struct, parent, word, pos = order_struct_parent_word_pos
+    file_texts = []
+    s = 0
+    # TODO: needs re-writing! cwb.tokens_and_vrt and cwb.vrt_iterate don't exist anymore
+    tokens, vrt = cwb.tokens_and_vrt(order, [(struct, parent)], [word] + ([pos] if pos else []))
+    for (label, span), cols in cwb.vrt_iterate(tokens, vrt):
+        words = b" ".join(vw_normalize(col[0])
+                          for col in cols
+                          if len(col[0]) >= min_word_length
+                          if not pos or col[1] not in banned_pos)
+        mapped_label = map_label(label) if map_label else label
+        if mapped_label:
+            file_texts.append(Text(mapped_label, span, words))
+        else:
+            s += 1
+    return file_texts, s
+
+
+# The label of an Example is the complete VW example prefix, including the namespace separator ("|")
 Example = namedtuple("Example", "label features tag")
 Example.__new__.__defaults__ = (None,)
 
+# Prefix for examples without label
+_NO_LABEL = b"| "
+
+# Number of bytes of examples to collect before writing them to vw
+_WRITE_BUFFER_SIZE = 1 << 16
+
 
 def vw_train(args, data):
     """
@@ -310,13 +362,13 @@ def vw_train(args, data):
 
     >>> with tempfile.NamedTemporaryFile() as tmp:
     ...     _ = vw_train(['--final_regressor', tmp.name, '--oaa', '2', '--quiet'],
-    ...                  [Example('1', 'a b c'), Example('2', 'c d e')])
+    ...                  [Example(b'1 | ', b'a b c'), Example(b'2 | ', b'c d e')])
     ...     list(vw_predict(['--initial_regressor', tmp.name, '--quiet'],
-    ...                     [Example(None, 'a b c', 'abc_tag'),
-    ...                      Example(None, 'c d e', 'cde_tag')]))
+    ...                     [Example(None, b'a b c', 'abc_tag'),
+    ...                      Example(None, b'c d e', 'cde_tag')]))
     ...     list(vw_predict(['--initial_regressor', tmp.name, '--quiet'],
-    ...                     [Example(None, 'a b c', 'abc_tag'),
-    ...                      Example(None, 'c d e', 'cde_tag')],
+    ...                     [Example(None, b'a b c', 'abc_tag'),
+    ...                      Example(None, b'c d e', 'cde_tag')],
     ...                     raw=True))
     ...                                         # doctest: +NORMALIZE_WHITESPACE
     [(1, 'abc_tag'), (2, 'cde_tag')]
@@ -331,55 +383,99 @@ def vw_predict(args, data, raw=False):
     Predict using vowpal wabbit on an iterator of Examples.
 
     Argument list is adjusted for testing and getting predictions as a stream.
+    vw is stopped if the predictions are not read to the end.
+
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     _ = vw_train(['--final_regressor', tmp.name, '--oaa', '2', '--quiet'],
+    ...                  [Example(b'1 | ', b'a b c'), Example(b'2 | ', b'c d e')])
+    ...     predictions = vw_predict(['--initial_regressor', tmp.name, '--quiet'],
+    ...                              (Example(None, b'a b c', i) for i in range(100000)))
+    ...     next(predictions)
+    ...     predictions.close()
+    (1, 0)
     """
-    if raw:
-        with tempfile.NamedTemporaryFile() as tmp:
-            more_args = ["--testonly", "-r", tmp.name]
-            tags = []
-            for _, tag in _vw_run(args + more_args, data, True):
-                tags.append(tag)
-            lines = open(tmp.name, "r").read().rstrip().split("\n")
-            for line, tag in zip(lines, tags):
-                def pred(label, raw_pred):
-                    return (int(label), float(raw_pred))
-                preds = tuple(pred(*p.split(":")) for p in line.split())
-                yield preds, tag
-    else:
-        more_args = ["--testonly"]
-        for x in _vw_run(args + more_args, data, True):
-            yield x
+    return _vw_run(args + ["--testonly"], data, True, raw)
+
+
+def _parse_prediction(line):
+    return int(float(line.split()[0]))
 
 
-def _vw_run(args, data, predict_and_yield):
-    vw = pyvw.vw(" ".join(args))
-    log.info("Running: vw " + " ".join(args))
-    for d in data:
-        ex = vw.example((d.label or b"") + b" | " + d.features + b"\n")
+def _parse_raw_prediction(line):
+    return tuple((int(label), float(raw_pred)) for label, raw_pred in (p.split(b":") for p in line.split()))
+
+
+def _vw_run(args, data, predict_and_yield, raw=False):
+    """Run the vw binary on an iterator of Examples, streaming the examples to its stdin.
+
+    If predict_and_yield is set, the predictions (or the raw predictions if raw is set) are read from stdout and
+    yielded together with the example tags.
+    """
+    if predict_and_yield:
+        args = args + ["--raw_predictions" if raw else "--predictions", "/dev/stdout"]
+        parse = _parse_raw_prediction if raw else _parse_prediction
+    process = util.system.call_binary("vw", args, verbose=True, return_command=True)
+    tags = deque()
+
+    def feed():
+        buf = bytearray()
+        try:
+            with process.stdin:
+                for d in data:
+                    tags.append(d.tag)
+                    # The label already ends with the namespace separator
+                    buf += d.label or _NO_LABEL
+                    buf += d.features
+                    buf += b"\n"
+                    if len(buf) >= _WRITE_BUFFER_SIZE:
+                        process.stdin.write(buf)
+                        buf.clear()
+                process.stdin.write(buf)
+        except BrokenPipeError:
+            # vw has exited (or been stopped) before reading all examples, which is handled below
+            pass
+
+    try:
         if predict_and_yield:
-            yield vw.predict(ex, pylibvw.vw.lMulticlass), d.tag
+            # Feed vw from a separate thread so that reading the predictions can't block the writing, and vice versa
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+            for line in process.stdout:
+                yield parse(line), tags.popleft()
+            feeder.join()
         else:
-            vw.learn(ex)
-    vw.finish()
+            feed()
+        process.wait()
+    finally:
+        # Stop vw if we didn't get to the end, e.g. because the predictions stopped being read
+        if process.returncode is None:
+            process.kill()
+            process.wait()
+    if process.returncode:
+        raise OSError("vw returned error code %d" % process.returncode)
 
 
 def vw_normalize(s):
     """
     Normalize a string so it can be used as a VW feature.
 
-    >>> print(vw_normalize(u'VW | abcåäö:123').decode('utf-8'))
+    >>> print(vw_normalize('VW | abcåäö:123').decode('utf-8'))
     vwSISabcåäöCXXX
     """
-    return s.lower().translate(_escape_table).encode("utf-8")
+    return s.lower().encode("utf-8").translate(_escape_table)
 
 
 # Replace digits with X
-_escape_symbols = [(str(x), u"X") for x in range(10)]
+_escape_symbols = [(str(x), "X") for x in range(10)]
 # Vowpal Wabbit needs these to be escaped:
-_escape_symbols += [(u" ", u"S"),  # separates features
-                    (u"|", u"I"),  # separates namespaces
-                    (u":", u"C")]  # separates feature and its value
+_escape_symbols += [(" ", "S"),  # separates features
+                    ("|", "I"),  # separates namespaces
+                    (":", "C")]  # separates feature and its value
 
-_escape_table = {ord(k): v for k, v in _escape_symbols}
+# All escaped symbols are ASCII, so the translation can be done on the UTF-8 encoded bytes (multi-byte sequences only
+# contain bytes above 0x7F)
+_escape_table = bytes.maketrans("".join(k for k, _ in _escape_symbols).encode(),
+                                "".join(v for _, v in _escape_symbols).encode())
 
 
 ################################################################################
@@ -406,7 +502,7 @@ class Performance:
         """Divide x/y, return 0 if divisor is 0."""
         if y == 0:
             return 0.0
-        return float(x) / float(y)
+        return x / y
 
     def harmonic_mean(self, x, y):
         """Calculate the harmonic mean."""
@@ -419,7 +515,7 @@ class Performance:
 
     def __repr__(self):
         """Return a string representation of the performance measures."""
-        perf = ", ".join("%s=%.3f" % kv for kv in list(self.as_dict().items()))
+        perf = ", ".join("%s=%.3f" % kv for kv in self.as_dict().items())
         return "Performance(" + perf + ")"
 
 
@@ -436,26 +532,43 @@ def binary_performance(target, predicted):
     >>> p.REC == 3/4.0
     True
     """
-    d = Counter(list(zip(target, predicted)))
+    d = Counter(zip(target, predicted))
     return Performance(TP=d[1, 1],
                        TN=d[0, 0],
                        FP=d[0, 1],
                        FN=d[1, 0])
 
 
-def multiclass_performance(target, predicted):
+def multiclass_performance(target, predicted, labels):
     """
+    Calculate performance measures for each of the labels.
+
     >>> multiclass_performance([1,1,1,1,2,2,3,3],
-    ...                        [1,1,1,2,2,1,1,3])
+    ...                        [1,1,1,2,2,1,1,3],
+    ...                        labels=[1,2,3])
     ...                                         # doctest: +NORMALIZE_WHITESPACE
     {1: Performance(ACC=0.625, PRE=0.600, REC=0.750, PRF=0.667),
      2: Performance(ACC=0.750, PRE=0.500, REC=0.500, PRF=0.500),
      3: Performance(ACC=0.875, PRE=1.000, REC=0.500, PRF=0.667)}
     """
-    return {
-        i: binary_performance((t == i for t in target), (p == i for p in predicted))
-        for i in nub(it.chain(target, predicted))
-    }
+    return multiclass_performance_from_pairs(Counter(zip(target, predicted)), labels)
+
+
+def multiclass_performance_from_pairs(pairs, labels):
+    """Calculate performance measures for each of the labels, from a Counter of (target, predicted) pairs."""
+    target_counts = Counter()
+    predicted_counts = Counter()
+    for (t, p), count in pairs.items():
+        target_counts[t] += count
+        predicted_counts[p] += count
+    n = sum(pairs.values())
+    performance = {}
+    for i in labels:
+        TP = pairs[i, i]
+        FP = predicted_counts[i] - TP
+        FN = target_counts[i] - TP
+        performance[i] = Performance(TP=TP, TN=n - TP - FP - FN, FP=FP, FN=FN)
+    return performance
 
 
 def confusion_matrix(target, predicted, order):
@@ -471,8 +584,12 @@ def confusion_matrix(target, predicted, order):
      [1, 1, 0],
      [1, 0, 1]]
     """
-    matrix = Counter(list(zip(target, predicted)))
-    return [[matrix.get((t, p), 0) for p in order] for t in order]
+    return confusion_matrix_from_pairs(Counter(zip(target, predicted)), order)
+
+
+def confusion_matrix_from_pairs(pairs, order):
+    """Calculate confusion matrix from a Counter of (target, predicted) pairs."""
+    return [[pairs[t, p] for p in order] for t in order]
 
 
 ################################################################################
@@ -507,11 +624,8 @@ def interleave(xs, k):
     >>> interleave('abcdABCD1234', 3)
     [('a', 'A', '1'), ('b', 'B', '2'), ('c', 'C', '3'), ('d', 'D', '4')]
     """
-    ts = [[] for _ in range(len(xs) // k)]  # Changed to floor division in python3
-    ts_iter = it.cycle(ts)
-    for x in xs:
-        next(ts_iter).append(x)
-    return [tuple(t) for t in ts]
+    n = len(xs) // k
+    return list(zip(*(xs[i * n:(i + 1) * n] for i in range(k))))
 
 
 def every(sep, generator, invert=False):
@@ -5,6 +5,7 @@ import io
 import logging
 import os
 import re
+import shutil
 import xml.etree.ElementTree as etree
 from typing import Optional
 
@@ -155,7 +156,8 @@ def combine(corpus, out, docs, xml_input):
         for infile in xml_files:
             log.info("Read: %s", infile)
             with open(infile) as inf:
-                print(inf.read(), file=outf)
+                shutil.copyfileobj(inf, outf)
+            print(file=outf)
         print("</corpus>", file=outf)
         log.info("Exported: %s" % out)
 
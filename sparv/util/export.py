@@ -84,7 +84,7 @@ def gather_annotations(annotations: List[Annotation],
             """
             def get_sort_key(span, sub_positions=False):
                 """Return a sort key for span which makes span comparison possible."""
-                hierarchy_index = elem_hierarchy.index(span.name) if span.name in elem_hierarchy else -1
+                hierarchy_index = elem_hierarchy.get(span.name, -1)
                 if sub_positions:
                     return (span.start, span.start_sub), (-span.end, -span.end_sub), hierarchy_index
                 else:
@@ -124,7 +124,8 @@ def gather_annotations(annotations: List[Annotation],
                     Annotation(f"{base_name}:{util.HEADER_CONTENTS}", doc=doc).read(allow_newlines=True))
 
     # Calculate hierarchy (if needed) and sort the span objects
-    elem_hierarchy = calculate_element_hierarchy(doc, spans_list)
+    # (elem_hierarchy maps element names to their position in the hierarchy, to avoid list scans while sorting)
+    elem_hierarchy = {elem: i for i, elem in enumerate(calculate_element_hierarchy(doc, spans_list))}
     sorted_spans = sorted(spans_list)
 
     # Add position information to sorted_spans
@@ -211,15 +212,20 @@ def calculate_element_hierarchy(doc, spans_list):
     # Flatten structure
     unclear_spans = set([elem for elem_set in span_duplicates for elem in elem_set])
 
+    # Read the spans of every unclear element only once, sorted the way read_parents_and_children expects them
+    annotations = {}
+    sorted_spans = {}
+    for elem in unclear_spans:
+        annotations[elem] = Annotation(elem, doc=doc)
+        sorted_spans[elem] = sorted(enumerate(annotations[elem].read_spans(decimals=True)), key=lambda x: x[1])
+
     # Get pairs of relations that need to be ordered
     relation_pairs = list(combinations(unclear_spans, r=2))
     # Order each pair into [parent, children]
     ordered_pairs = set()
     for a, b in relation_pairs:
-        a_annot = Annotation(a, doc=doc)
-        b_annot = Annotation(b, doc=doc)
-        a_parent = len([i for i in (b_annot.get_parents(a_annot)) if i is not None])
-        b_parent = len([i for i in (a_annot.get_parents(b_annot)) if i is not None])
+        a_parent = _count_children_with_parent(annotations[b], sorted_spans[a], sorted_spans[b])
+        b_parent = _count_children_with_parent(annotations[a], sorted_spans[b], sorted_spans[a])
         if a_parent > b_parent:
             ordered_pairs.add((a, b))
         else:
@@ -244,6 +250,23 @@ def calculate_element_hierarchy(doc, spans_list):
     return hierarchy
 
 
+def _count_children_with_parent(child, parent_spans, child_spans):
+    """Count the children that have a parent, using pre-read spans sorted by position.
+
+    This gives the same result as counting the non-None values from child.get_parents(), without reading the child
+    annotation again.
+    """
+    parents, children = child.read_parents_and_children(parent_spans, child_spans)
+    parent_span = next(parents, (None, None))[1]
+    count = 0
+    for _child_i, child_span in children:
+        while parent_span is not None and child_span[1] > parent_span[1]:
+            parent_span = next(parents, (None, None))[1]
+        if parent_span is not None and parent_span[0] <= child_span[0]:
+            count += 1
+    return count
+
+
 def get_available_source_annotations(doc: Optional[str] = None, docs: Optional[List[str]] = None) -> Set[str]:
     """Get the set of available annotations generated from the source, either for a single document or multiple."""
     assert doc or docs, "Either 'doc' or 'docs' must be provided"
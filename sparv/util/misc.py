@@ -11,6 +11,11 @@ from .classes import Annotation, Model
 
 _log = logging.getLogger(__name__)
 
+# Translation table for removing control characters (all characters in Unicode category Cc are below U+0100)
+_CONTROL_CHARACTERS = {i: None for i in range(0x100) if unicodedata.category(chr(i)) == "Cc"}
+# Translation table for removing control characters except for line breaks and tabs, also used when escaping export data
+CONTROL_CHARACTERS_KEEP_WHITESPACE = {i: None for i in _CONTROL_CHARACTERS if chr(i) not in "\n\t\r"}
+
 
 class SparvErrorMessage(Exception):
     """Exception used to notify users of errors in a friendly way without displaying traceback."""
@@ -126,7 +131,8 @@ def cwbset(values, delimiter="|", affix="|", sort=False, maxlength=4095, encodin
     values = list(values)
     if sort:
         values.sort()
-    if maxlength:
+    # Encode all values at once, and only encode them one by one if the set needs to be truncated
+    if maxlength and 1 + len(values) + len("".join(values).encode(encoding)) > maxlength:
         length = 1  # Including the last affix
         for i, value in enumerate(values):
             length += len(value.encode(encoding)) + 1
@@ -147,8 +153,10 @@ def set_to_list(setstring, delimiter="|", affix="|"):
 def remove_control_characters(text, keep: Optional[str] = None):
     """Remove control characters from text, except for those in 'keep'."""
     if keep is None:
-        keep = ["\n", "\t", "\r"]
-    return "".join(c for c in text if c in keep or unicodedata.category(c)[0:2] != "Cc")
+        table = CONTROL_CHARACTERS_KEEP_WHITESPACE
+    else:
+        table = {i: None for i in _CONTROL_CHARACTERS if chr(i) not in keep}
+    return text.translate(table)
 
 
 def remove_formatting_characters(text, keep: Optional[str] = None):
@@ -182,6 +190,13 @@ def chain(annotations, default=None):
      'w:4': 'The Principia Discordia',
      'w:5': 'The Principia Discordia'}
     """
+    # Fast paths for the common cases, avoiding a function call per key
+    if len(annotations) == 1:
+        return iter(annotations[0].items())
+    if len(annotations) == 2:
+        first, second = annotations
+        return ((key, second.get(value, default)) for key, value in first.items())
+
     def follow(key):
         for annot in annotations:
             try:
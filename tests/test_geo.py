@@ -0,0 +1,35 @@
+"""Tests for building the geo model from Geonames dumps."""
+
+import pickle
+
+from sparv.modules.geo.geo import pickle_model
+from sparv.util import Model
+
+CITIES = "\t".join(["2673730", "Stockholm", "Stockholm", "", "59.33258", "18.0649", "P", "PPLC", "SE", "", "26", "",
+                    "", "", "1515017", "", "28", "Europe/Stockholm", "2019-11-26"]) + "\n"
+# The second name contains a bare carriage return, and the dump ends with a whitespace-only line
+ALTERNATE_NAMES = ("1\t2673730\tsv\tStockholm\t1\t\t\t\n"
+                   "2\t2673730\ten\tStock\rholm\t\t\t\t\n"
+                   " \n")
+
+
+def test_pickle_model(tmp_path):
+    """Build a geo model from dumps with a line break character within a field and a whitespace-only line."""
+    cities = tmp_path / "cities1000.txt"
+    alternate_names = tmp_path / "alternateNames.txt"
+    out = tmp_path / "geo.pickle"
+    cities.write_text(CITIES, encoding="utf-8", newline="")
+    alternate_names.write_text(ALTERNATE_NAMES, encoding="utf-8", newline="")
+
+    pickle_model(Model(str(cities)), Model(str(alternate_names)), Model(str(out)))
+
+    with open(out, "rb") as f:
+        result = pickle.load(f)
+    assert result == {"2673730": {
+        "name": "Stockholm",
+        "alternative_names": {"sv": ["Stockholm"], "en": ["Stock\rholm"]},
+        "latitude": "59.33258",
+        "longitude": "18.0649",
+        "country": "SE",
+        "population": "1515017"
+    }}